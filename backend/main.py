@@ -7,26 +7,79 @@ Uses Groq for LLM responses with streaming support.
 
 import os
 import json
+import logging
 import asyncio
-from typing import Optional
+import time
+import uuid
+from contextlib import asynccontextmanager
+from types import MappingProxyType
+from typing import AsyncIterator, Optional
 from datetime import datetime
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from dotenv import load_dotenv
+import orjson
 
+import httpx
+import redis.asyncio as aioredis
 from groq import AsyncGroq
 import google.generativeai as genai
 
 # Load environment variables
 load_dotenv()
 
+# Logging (WARNING by default; set LOG_LEVEL=DEBUG for per-message traces).
+# The same name drives uvicorn, so only accept levels both parsers know.
+LOG_LEVELS = ("CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG")
+LOG_LEVEL_ALIASES = {"WARN": "WARNING", "FATAL": "CRITICAL"}
+_requested_level = os.getenv("LOG_LEVEL", "WARNING").upper()
+LOG_LEVEL = LOG_LEVEL_ALIASES.get(_requested_level, _requested_level)
+_unknown_level = LOG_LEVEL not in LOG_LEVELS
+if _unknown_level:
+    LOG_LEVEL = "WARNING"
+logging.basicConfig(level=LOG_LEVEL)
+log = logging.getLogger("avatar")
+if _unknown_level:
+    log.warning("Unknown LOG_LEVEL %r; using WARNING", _requested_level)
+
+# Shared state store: Redis when configured (required for multiple workers)
+REDIS_URL = os.getenv("REDIS_URL")
+HISTORY_TTL = int(os.getenv("HISTORY_TTL", 3600))  # seconds
+
+# Worker processes: `python main.py` reads WORKERS, the uvicorn CLI reads WEB_CONCURRENCY.
+# History lives in-process unless Redis is configured, so only scale out with Redis
+WORKERS = int(
+    os.getenv("WORKERS")
+    or os.getenv("WEB_CONCURRENCY")
+    or ((os.cpu_count() or 2) if REDIS_URL else 1)
+)
+if WORKERS > 1 and not REDIS_URL:
+    log.warning("%d workers configured without REDIS_URL; conversation history "
+                "will not be shared between workers.", WORKERS)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the Redis pool for this worker and close shared connections on shutdown"""
+    global history_store
+    redis_client = None
+    if REDIS_URL:
+        redis_client = aioredis.from_url(REDIS_URL)
+        history_store = RedisHistoryStore(redis_client, HISTORY_TTL)
+        log.info("Conversation history stored in Redis")
+    yield
+    await groq_http_client.aclose()
+    if redis_client is not None:
+        await redis_client.aclose()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="AI Avatar Backend",
     description="Real-time AI avatar interaction server",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Configure CORS for local development
@@ -42,21 +95,36 @@ app.add_middleware(
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
+# One pooled HTTP/2 connection set per worker, reused by every Groq client
+# (including ones created by /api/configure) and closed on shutdown
+groq_http_client = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=32, keepalive_expiry=60),
+)
+
+def make_groq_client(api_key: str) -> AsyncGroq:
+    """Groq client on the shared HTTP/2 pool"""
+    return AsyncGroq(api_key=api_key, http_client=groq_http_client)
+
+def configure_gemini(api_key: str):
+    """Configure Gemini on the async gRPC transport so its channel stays warm"""
+    genai.configure(api_key=api_key, transport="grpc_asyncio")
+    return genai.GenerativeModel('gemini-2.0-flash')
+
 # Initialize clients
 if GROQ_API_KEY:
-    groq_client = AsyncGroq(api_key=GROQ_API_KEY)
-    print("✅ Groq configured (Async)")
+    groq_client = make_groq_client(GROQ_API_KEY)
+    log.info("Groq configured (Async)")
 else:
     groq_client = None
-    print("⚠️  WARNING: GROQ_API_KEY not configured.")
+    log.warning("GROQ_API_KEY not configured.")
 
 if GEMINI_API_KEY and GEMINI_API_KEY != "your_gemini_api_key_here":
-    genai.configure(api_key=GEMINI_API_KEY)
-    gemini_model = genai.GenerativeModel('gemini-2.0-flash')
-    print("✅ Gemini configured")
+    gemini_model = configure_gemini(GEMINI_API_KEY)
+    log.info("Gemini configured")
 else:
     gemini_model = None
-    print("⚠️  WARNING: GEMINI_API_KEY not configured.")
+    log.warning("GEMINI_API_KEY not configured.")
 
 # System prompt for the AI avatar
 SYSTEM_PROMPT = """You are Sara, a Lead Engineer at AdxReel.
@@ -73,143 +141,446 @@ User: "Tell me about the role."
 You: "We're building real-time AI avatars. I need someone strong in Python and Three.js. How is your experience with WebGL?"
 """
 
+# System message shared by every Groq request; read-only so no coroutine can
+# mutate it, keeping the prompt prefix byte-identical turn after turn
+_SYSTEM_MSG = MappingProxyType({"role": "system", "content": SYSTEM_PROMPT})
+
+# Fixed head of every Gemini prompt
+_GEMINI_PREFIX = SYSTEM_PROMPT + "\n\nConversation so far:\n"
+
+# Per-session history window: grows append-only up to HISTORY_MAX_WINDOW,
+# then drops back to the last HISTORY_KEEP messages in one step
+HISTORY_MAX_WINDOW = 20
+HISTORY_KEEP = 10
+
+class ConversationHistory:
+    """Append-only conversation window with deferred truncation.
+    
+    Sliding the window by one message per turn shifts the prompt prefix on
+    every request, so upstream prefix caches never hit. Instead the window
+    only grows, and is cut back in a single reset once it gets too long.
+    """
+    def __init__(self, max_window: int = HISTORY_MAX_WINDOW, keep: int = HISTORY_KEEP):
+        self.max_window = max_window
+        self.keep = keep
+        self.messages: list[dict] = []
+    
+    def append(self, message: dict):
+        self.messages.append(message)
+        if len(self.messages) >= self.max_window:
+            del self.messages[:-self.keep]
+    
+    def clear(self):
+        self.messages.clear()
+    
+    def __iter__(self):
+        return iter(self.messages)
+    
+    def __len__(self):
+        return len(self.messages)
+
+class MemoryHistoryStore:
+    """In-process history store; only valid with a single worker"""
+    def __init__(self):
+        self.histories: dict[str, ConversationHistory] = {}
+    
+    async def get(self, session_id: str) -> Optional[list[dict]]:
+        history = self.histories.get(session_id)
+        return list(history) if history is not None else None
+    
+    async def save(self, session_id: str, history: ConversationHistory):
+        self.histories[session_id] = history
+    
+    async def delete(self, session_id: str) -> bool:
+        history = self.histories.pop(session_id, None)
+        if history is None:
+            return False
+        history.clear()  # The live connection holds the same object
+        return True
+    
+    async def close_session(self, session_id: str):
+        self.histories.pop(session_id, None)
+
+class RedisHistoryStore:
+    """History store shared by all workers; entries expire after `ttl` seconds.
+    
+    Each connection keeps its own ConversationHistory and writes it through
+    here, so the turn path never reads from Redis. Deleting a session clears
+    the stored copy only; a live connection resets its window via "reset".
+    """
+    def __init__(self, client: aioredis.Redis, ttl: int):
+        self.client = client
+        self.ttl = ttl
+    
+    @staticmethod
+    def _key(session_id: str) -> str:
+        return f"history:{session_id}"
+    
+    async def get(self, session_id: str) -> Optional[list[dict]]:
+        raw = await self.client.get(self._key(session_id))
+        return orjson.loads(raw) if raw is not None else None
+    
+    async def save(self, session_id: str, history: ConversationHistory):
+        await self.client.setex(self._key(session_id), self.ttl, orjson.dumps(history.messages))
+    
+    async def delete(self, session_id: str) -> bool:
+        return await self.client.delete(self._key(session_id)) > 0
+    
+    async def close_session(self, session_id: str):
+        # Left to expire via TTL so the history stays readable after disconnect
+        pass
+
+history_store = MemoryHistoryStore()
 
-# Conversation history for context
-conversation_history = []
+# Pre-encoded envelope for token frames; only the content is serialized per token
+_TOKEN_PREFIX = b'{"type":"token","content":'
+_TOKEN_SUFFIX = b'}'
 
 class ConnectionManager:
     """Manages WebSocket connections"""
     def __init__(self):
         self.active_connections: list[WebSocket] = []
     
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket) -> str:
         await websocket.accept()
+        session_id = uuid.uuid4().hex
+        websocket.state.session_id = session_id
         self.active_connections.append(websocket)
-        print(f"✅ Client connected. Total connections: {len(self.active_connections)}")
+        log.debug("Client connected. Total connections: %d", len(self.active_connections))
+        return session_id
     
-    def disconnect(self, websocket: WebSocket):
+    async def disconnect(self, websocket: WebSocket):
         self.active_connections.remove(websocket)
-        print(f"❌ Client disconnected. Total connections: {len(self.active_connections)}")
+        await history_store.close_session(websocket.state.session_id)
+        log.debug("Client disconnected. Total connections: %d", len(self.active_connections))
+    
+    async def _send_bytes(self, websocket: WebSocket, payload: bytes):
+        # Raw ASGI send with an already-encoded payload. The message dict is not
+        # reused: servers and test transports may hold it after send() returns
+        await websocket.send({"type": "websocket.send", "bytes": payload})
     
     async def send_message(self, websocket: WebSocket, message: dict):
-        await websocket.send_json(message)
+        await self._send_bytes(websocket, orjson.dumps(message))
+    
+    async def send_token(self, websocket: WebSocket, content: str):
+        """Send a token frame without re-serializing the constant envelope"""
+        await self._send_bytes(websocket, _TOKEN_PREFIX + orjson.dumps(content) + _TOKEN_SUFFIX)
 
 manager = ConnectionManager()
 
+# Token coalescing thresholds
+FLUSH_BYTES = 64
+FLUSH_INTERVAL = 0.02  # seconds
+SENTENCE_ENDINGS = (".", "!", "?", "\n")
+
+class TokenBuffer:
+    """Coalesces streamed tokens into fewer WebSocket frames.
+    
+    Tokens accumulate while a previous frame is still being sent, so the
+    producer keeps pulling from the LLM stream instead of awaiting each send.
+    The first token goes out immediately, and a timer flushes anything left
+    buffered once FLUSH_INTERVAL passes, even if the provider stalls.
+    """
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.loop = asyncio.get_running_loop()
+        self.buf = bytearray()
+        self.last_flush = float("-inf")
+        self.pending: Optional[asyncio.Task] = None
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.error: Optional[BaseException] = None
+    
+    def _sending(self) -> bool:
+        return self.pending is not None and not self.pending.done()
+    
+    def push(self, content: str):
+        if self.error is not None:
+            raise self.error  # Surface send errors
+        self.buf += content.encode()
+        if self._sending():
+            return  # Flushed from _on_sent once the in-flight frame is out
+        if (len(self.buf) >= FLUSH_BYTES
+                or self.loop.time() - self.last_flush >= FLUSH_INTERVAL
+                or content.endswith(SENTENCE_ENDINGS)):
+            self._flush()
+        else:
+            self._arm()
+    
+    def _arm(self):
+        if self.timer is None:
+            delay = max(0.0, self.last_flush + FLUSH_INTERVAL - self.loop.time())
+            self.timer = self.loop.call_later(delay, self._on_timer)
+    
+    def _on_timer(self):
+        self.timer = None
+        if self.buf and not self._sending():
+            self._flush()
+    
+    def _on_sent(self, task: asyncio.Task):
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.error = task.exception()
+            return
+        if self.buf:
+            self._arm()
+    
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        payload = self.buf.decode()
+        self.buf.clear()
+        self.last_flush = self.loop.time()
+        self.pending = asyncio.create_task(manager.send_token(self.websocket, payload))
+        self.pending.add_done_callback(self._on_sent)
+    
+    async def close(self):
+        """Wait for the in-flight frame and send whatever is left"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.pending is not None:
+            await self.pending
+            self.pending = None
+        if self.buf:
+            payload = self.buf.decode()
+            self.buf.clear()
+            await manager.send_token(self.websocket, payload)
+    
+    def abort(self):
+        """Drop buffered text and stop any in-flight send"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.pending is not None:
+            self.pending.cancel()
+            self.pending = None
+        self.buf.clear()
+
 @app.get("/")
 async def root():
     """Root endpoint"""
     return {"message": "AI Avatar Backend Server", "status": "running", "provider": "Groq" if groq_client else "Gemini"}
 
-@app.get("/api/health")
-async def health_check():
-    """Health check endpoint"""
-    return {
+# Invariant part of the health response; rebuilt when providers are reconfigured
+_HEALTH_TEMPLATE: dict = {}
+
+def _refresh_health_template():
+    global _HEALTH_TEMPLATE
+    _HEALTH_TEMPLATE = {
         "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
         "groq_configured": groq_client is not None,
         "gemini_configured": gemini_model is not None,
-        "active_connections": len(manager.active_connections)
     }
 
+_refresh_health_template()
+
+# (second, isoformat) - the timestamp is only reformatted once per second
+_ts_cache = (0, "")
+
+def _health_timestamp() -> str:
+    global _ts_cache
+    now = int(time.time())
+    if now != _ts_cache[0]:
+        _ts_cache = (now, datetime.fromtimestamp(now).isoformat())
+    return _ts_cache[1]
+
+@app.get("/api/health")
+async def health_check():
+    """Health check endpoint"""
+    return ORJSONResponse({
+        **_HEALTH_TEMPLATE,
+        "timestamp": _health_timestamp(),
+        "active_connections": len(manager.active_connections)
+    })
+
 @app.post("/api/configure")
 async def configure_api(api_key: str, provider: str = "groq"):
-    """Configure API key at runtime"""
+    """Configure API key at runtime (single worker only)"""
     global groq_client, gemini_model
+    if WORKERS > 1:
+        # Only the worker handling this request would see the new client
+        raise HTTPException(
+            status_code=409,
+            detail="Runtime configuration is not supported with multiple workers; "
+                   "set GROQ_API_KEY / GEMINI_API_KEY in the environment instead"
+        )
     try:
+        # The swap has no awaits, so it runs atomically on the event loop.
+        # Handlers snapshot the clients once per turn, so it never affects a
+        # response that is already streaming
         if provider.lower() == "groq":
-            groq_client = AsyncGroq(api_key=api_key)
+            groq_client = make_groq_client(api_key)
+            _refresh_health_template()
             return {"status": "success", "message": "Groq configured successfully"}
         else:
-            genai.configure(api_key=api_key)
-            gemini_model = genai.GenerativeModel('gemini-2.0-flash')
+            gemini_model = configure_gemini(api_key)
+            _refresh_health_template()
             return {"status": "success", "message": "Gemini configured successfully"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-async def generate_groq_response(websocket: WebSocket, messages: list):
-    """Generate and stream response using Groq"""
+async def stream_groq_tokens(client: AsyncGroq, messages: ConversationHistory) -> AsyncIterator[str]:
+    """Stream response tokens from Groq"""
+    # History entries are already in Groq's {"role", "content"} shape
+    groq_messages = [_SYSTEM_MSG, *messages]
+    
+    # Create stream
+    stream = await client.chat.completions.create(
+        model="llama-3.3-70b-versatile",  # Switched to 70B (8B decommissioned)
+        messages=groq_messages,
+        stream=True,
+        temperature=0.7,
+        max_tokens=150,  # Relaxed limit for natural speech
+    )
     try:
-        # Build messages for Groq chat completion
-        groq_messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-        # Filter and add conversation history
-        for msg in messages[-10:]:
-            role = "user" if msg["role"] == "user" else "assistant"
-            content = msg["content"]
-            # Map roles for Groq
-            groq_messages.append({"role": role, "content": content})
-        
-        # Create stream
-        stream = await groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",  # Switched to 70B (8B decommissioned)
-            messages=groq_messages,
-            stream=True,
-            temperature=0.7,
-            max_tokens=150,  # Relaxed limit for natural speech
-        )
-        
-        full_response = ""
         async for chunk in stream:
-            if chunk.choices[0].delta.content:
-                content = chunk.choices[0].delta.content
-                full_response += content
-                await manager.send_message(websocket, {
-                    "type": "token",
-                    "content": content
-                })
-        
-        return full_response
-    except Exception as e:
-        raise e
+            content = chunk.choices[0].delta.content
+            if content:
+                yield content
+    finally:
+        # Release the HTTP connection if we stop early (e.g. lost the race)
+        await stream.response.aclose()
 
-async def generate_gemini_response(websocket: WebSocket, messages: list):
-    """Generate and stream response using Gemini"""
-    try:
-        # Build conversation context
-        context = SYSTEM_PROMPT + "\n\nConversation so far:\n"
-        for msg in messages[-10:]:  # Keep last 10 messages for context
-            role = "Interviewer" if msg["role"] == "user" else "You"
-            context += f"{role}: {msg['content']}\n"
-        context += "\nYou:"
-        
-        # Generate streaming response
-        response = gemini_model.generate_content(
-            context,
-            stream=True,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.7,
-                max_output_tokens=500,
-            )
+async def _close_gemini_response(response):
+    """Close the SDK's underlying stream iterator.
+    
+    The SDK does not expose the gRPC call, but closing its iterator drops the
+    last reference to it, and grpc cancels a call that is released unfinished.
+    """
+    iterator = getattr(response, "_iterator", None)
+    if iterator is not None and hasattr(iterator, "aclose"):
+        await iterator.aclose()
+
+async def stream_gemini_tokens(model, messages: ConversationHistory) -> AsyncIterator[str]:
+    """Stream response tokens from Gemini"""
+    # Build conversation context
+    parts = [_GEMINI_PREFIX]
+    parts.extend(
+        f"{'Interviewer' if msg['role'] == 'user' else 'You'}: {msg['content']}\n"
+        for msg in messages
+    )
+    parts.append("\nYou:")
+    context = "".join(parts)
+    
+    # Generate streaming response
+    response = await model.generate_content_async(
+        context,
+        stream=True,
+        generation_config=genai.types.GenerationConfig(
+            temperature=0.7,
+            max_output_tokens=500,
         )
-        
-        full_response = ""
-        for chunk in response:
+    )
+    try:
+        async for chunk in response:
             if chunk.text:
-                full_response += chunk.text
-                await manager.send_message(websocket, {
-                    "type": "token",
-                    "content": chunk.text
-                })
-                await asyncio.sleep(0.01)
-        
-        return full_response
+                yield chunk.text
+    finally:
+        # Mirror stream_groq_tokens: stop the gRPC stream as soon as we stop
+        # reading (e.g. lost the race) instead of waiting for garbage collection
+        await _close_gemini_response(response)
+
+async def _first_token(stream: AsyncIterator[str]) -> str:
+    return await stream.__anext__()
+
+class AllProvidersFailed(RuntimeError):
+    """Raised when no provider produced a token; `errors` maps provider to reason"""
+    def __init__(self, errors: dict[str, str]):
+        self.errors = errors
+        super().__init__("; ".join(f"{name}: {reason}" for name, reason in errors.items()))
+
+async def race_providers(streams: dict[str, AsyncIterator[str]]) -> tuple[str, str, AsyncIterator[str]]:
+    """Start every provider at once and keep whichever produces a token first.
+    
+    Returns (provider, first_token, stream). The losing streams are cancelled
+    and closed. Raises AllProvidersFailed, listing every provider's error, if
+    none of them produce output.
+    """
+    pending = {asyncio.create_task(_first_token(stream)): name for name, stream in streams.items()}
+    errors: dict[str, str] = {}
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = pending.pop(task)
+                try:
+                    token = task.result()
+                except StopAsyncIteration:
+                    errors[name] = "returned an empty response"
+                except Exception as e:
+                    errors[name] = str(e) or type(e).__name__
+                else:
+                    return name, token, streams[name]
+                log.warning("%s failed: %s", name, errors[name])
+        raise AllProvidersFailed(errors)
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for task, name in pending.items():
+            await streams[name].aclose()
+
+async def forward_response(websocket: WebSocket, first_token: str, stream: AsyncIterator[str]) -> str:
+    """Forward the winning provider's tokens to the client and return the full text"""
+    full_response = first_token
+    buffer = TokenBuffer(websocket)
+    buffer.push(first_token)
+    try:
+        async for content in stream:
+            full_response += content
+            buffer.push(content)
+    except BaseException:
+        buffer.abort()
+        raise
+    finally:
+        await stream.aclose()
+    await buffer.close()
+    
+    return full_response
+
+async def _record_reply(session_id: str, history: ConversationHistory, content: str):
+    """Append the assistant reply and persist the session history"""
+    history.append({
+        "role": "assistant",
+        "content": content
+    })
+    try:
+        await history_store.save(session_id, history)
     except Exception as e:
-        raise e
+        # The reply already reached the client; losing the save must not drop the session
+        log.warning("Failed to save history for session %s: %s", session_id, e)
 
 @app.websocket("/ws/chat")
 async def websocket_chat(websocket: WebSocket):
     """WebSocket endpoint for real-time chat with streaming responses"""
-    await manager.connect(websocket)
+    session_id = await manager.connect(websocket)
+    pending_save: Optional[asyncio.Task] = None
     
     try:
+        # This handler is the only writer for its session, so the history stays
+        # local and is only written through to the store
+        history = ConversationHistory()
+        await history_store.save(session_id, history)
+        await manager.send_message(websocket, {
+            "type": "session",
+            "session_id": session_id
+        })
+        
         while True:
             # Receive message from client
-            data = await websocket.receive_json()
+            data = orjson.loads(await websocket.receive_text())
+            
+            # The previous reply must be stored before this turn touches history
+            if pending_save is not None:
+                await pending_save
+                pending_save = None
             message_type = data.get("type", "message")
             
             if message_type == "message":
                 user_message = data.get("content", "")
-                print(f"📩 Received message: {user_message}")
+                log.debug("Received message: %s", user_message)
                 
                 if not user_message:
                     await manager.send_message(websocket, {
@@ -219,13 +590,18 @@ async def websocket_chat(websocket: WebSocket):
                     continue
                 
                 # Add to conversation history
-                conversation_history.append({
+                history.append({
                     "role": "user",
                     "content": user_message
                 })
                 
+                # Snapshot the clients so a concurrent /api/configure can't swap them mid-turn
+                groq = groq_client
+                gemini = gemini_model
+                
                 # Check if any provider is configured
-                if groq_client is None and gemini_model is None:
+                if groq is None and gemini is None:
+                    await history_store.save(session_id, history)
                     await manager.send_message(websocket, {
                         "type": "error",
                         "content": "No LLM provider configured. Please set an API key."
@@ -238,15 +614,17 @@ async def websocket_chat(websocket: WebSocket):
                     "content": "Thinking..."
                 })
                 
+                # Race all configured providers; only the first to stream wins
+                streams = {}
+                if groq:
+                    streams["groq"] = stream_groq_tokens(groq, history)
+                if gemini:
+                    streams["gemini"] = stream_gemini_tokens(gemini, history)
+                
                 try:
-                    full_response = ""
-                    # Prioritize Groq as it's typically faster and less likely to hit free-tier quotas
-                    if groq_client:
-                        print("Using Groq...")
-                        full_response = await generate_groq_response(websocket, conversation_history)
-                    elif gemini_model:
-                        print("Using Gemini...")
-                        full_response = await generate_gemini_response(websocket, conversation_history)
+                    provider, first_token, stream = await race_providers(streams)
+                    log.debug("Streaming response from %s", provider)
+                    full_response = await forward_response(websocket, first_token, stream)
                     
                     # Send completion signal
                     await manager.send_message(websocket, {
@@ -254,31 +632,14 @@ async def websocket_chat(websocket: WebSocket):
                         "content": full_response
                     })
                     
-                    # Add to conversation history
-                    conversation_history.append({
-                        "role": "assistant",
-                        "content": full_response
-                    })
+                    # Record the reply off the hot path so we go straight back to receiving
+                    pending_save = asyncio.create_task(
+                        _record_reply(session_id, history, full_response)
+                    )
                     
                 except Exception as e:
-                    print(f"Error generating response: {e}")
-                    # If Groq failed, try Gemini as fallback if available
-                    if groq_client and gemini_model:
-                        try:
-                            print("Groq failed, trying Gemini fallback...")
-                            full_response = await generate_gemini_response(websocket, conversation_history)
-                            await manager.send_message(websocket, {
-                                "type": "complete",
-                                "content": full_response
-                            })
-                            conversation_history.append({
-                                "role": "assistant",
-                                "content": full_response
-                            })
-                            continue
-                        except Exception as gemini_e:
-                            print(f"Gemini fallback also failed: {gemini_e}")
-                    
+                    log.warning("Error generating response: %s", e)
+                    await history_store.save(session_id, history)
                     await manager.send_message(websocket, {
                         "type": "error",
                         "content": f"Error generating response: {str(e)}"
@@ -286,7 +647,8 @@ async def websocket_chat(websocket: WebSocket):
             
             elif message_type == "reset":
                 # Clear conversation history
-                conversation_history.clear()
+                history.clear()
+                await history_store.save(session_id, history)
                 await manager.send_message(websocket, {
                     "type": "reset_complete",
                     "content": "Conversation reset"
@@ -295,29 +657,51 @@ async def websocket_chat(websocket: WebSocket):
             elif message_type == "ping":
                 await manager.send_message(websocket, {
                     "type": "pong",
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": time.time()
                 })
     
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
     except Exception as e:
-        print(f"WebSocket error: {e}")
-        manager.disconnect(websocket)
-
-@app.get("/api/conversation")
-async def get_conversation():
-    """Get current conversation history"""
-    return {"history": conversation_history}
-
-@app.delete("/api/conversation")
-async def clear_conversation():
-    """Clear conversation history"""
-    conversation_history.clear()
+        log.error("WebSocket error: %s", e)
+    finally:
+        # Let a reply recorded just before the disconnect finish saving
+        if pending_save is not None:
+            await pending_save
+        await manager.disconnect(websocket)
+
+@app.get("/api/conversation/{session_id}")
+async def get_conversation(session_id: str):
+    """Get conversation history for a session"""
+    history = await history_store.get(session_id)
+    if history is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"history": history}
+
+@app.delete("/api/conversation/{session_id}")
+async def clear_conversation(session_id: str):
+    """Clear conversation history for a session"""
+    if not await history_store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
     return {"status": "cleared"}
 
 if __name__ == "__main__":
     import uvicorn
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", 8000))
-    print(f"🚀 Starting AI Avatar Backend on {host}:{port}")
-    uvicorn.run(app, host=host, port=port)
\ No newline at end of file
+    print(f"🚀 Starting AI Avatar Backend on {host}:{port} ({WORKERS} worker(s))")
+    # "auto" picks uvloop + httptools (installed by uvicorn[standard]) where the
+    # platform supports them, and falls back to asyncio + h11 elsewhere (e.g. Windows)
+    uvicorn.run(
+        # Workers re-import the app by name; a single process reuses this module
+        # (avoids configuring clients twice and works from any directory)
+        "main:app" if WORKERS > 1 else app,
+        host=host,
+        port=port,
+        workers=WORKERS,
+        loop="auto",
+        http="auto",
+        ws="websockets",
+        log_level=LOG_LEVEL.lower(),
+        access_log=False,
+    )
\ No newline at end of file
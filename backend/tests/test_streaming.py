@@ -0,0 +1,134 @@
+"""
+Tests for token coalescing (TokenBuffer) and the provider race (race_providers)
+"""
+
+import asyncio
+
+import orjson
+import pytest
+
+import main
+
+
+class FakeWebSocket:
+    """Records the content of every token frame sent through ConnectionManager"""
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.sent: list[str] = []
+
+    async def send(self, message: dict):
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError("socket closed")
+        self.sent.append(orjson.loads(message["bytes"])["content"])
+
+
+class FakeStream:
+    """Async token stream that records whether it was closed"""
+    def __init__(self, tokens=(), delay: float = 0.0, error: Exception = None):
+        self.tokens = list(tokens)
+        self.delay = delay
+        self.error = error
+        self.closed = False
+        self._gen = self._run()
+
+    async def _run(self):
+        try:
+            await asyncio.sleep(self.delay)
+            if self.error is not None:
+                raise self.error
+            for token in self.tokens:
+                yield token
+        finally:
+            self.closed = True
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        return self._gen.__anext__()
+
+    async def aclose(self):
+        await self._gen.aclose()
+
+
+def test_first_token_flushes_immediately():
+    async def scenario():
+        ws = FakeWebSocket()
+        buffer = main.TokenBuffer(ws)
+        buffer.push("Sure,")
+        await asyncio.sleep(0.001)
+        return ws.sent
+
+    assert asyncio.run(scenario()) == ["Sure,"]
+
+
+def test_timer_flushes_stalled_buffer():
+    async def scenario():
+        ws = FakeWebSocket()
+        buffer = main.TokenBuffer(ws)
+        buffer.push("Sure,")
+        await asyncio.sleep(0.001)
+        buffer.push(" let")  # Short, no sentence ending, inside the flush window
+        await asyncio.sleep(0)
+        before = list(ws.sent)
+        await asyncio.sleep(main.FLUSH_INTERVAL * 3)  # Provider stalls
+        return before, ws.sent
+
+    before, after = asyncio.run(scenario())
+    assert before == ["Sure,"]
+    assert after == ["Sure,", " let"]
+
+
+def test_send_error_surfaces_on_next_push():
+    async def scenario():
+        buffer = main.TokenBuffer(FakeWebSocket(fail=True))
+        buffer.push("Hello")
+        await asyncio.sleep(0.001)
+        with pytest.raises(RuntimeError, match="socket closed"):
+            buffer.push(" world")
+
+    asyncio.run(scenario())
+
+
+def test_losing_stream_is_closed():
+    async def scenario():
+        fast = FakeStream(["fast", " reply"])
+        slow = FakeStream(["slow"], delay=0.05)
+        provider, token, stream = await main.race_providers({"groq": fast, "gemini": slow})
+        rest = [t async for t in stream]
+        return provider, token, rest, slow.closed
+
+    provider, token, rest, slow_closed = asyncio.run(scenario())
+    assert (provider, token, rest) == ("groq", "fast", [" reply"])
+    assert slow_closed
+
+
+@pytest.mark.parametrize("loser", [
+    FakeStream(error=RuntimeError("invalid api key")),
+    FakeStream([]),
+])
+def test_failed_or_empty_provider_drops_out(loser):
+    async def scenario():
+        winner = FakeStream(["ok"], delay=0.02)
+        provider, token, _ = await main.race_providers({"groq": loser, "gemini": winner})
+        return provider, token
+
+    assert asyncio.run(scenario()) == ("gemini", "ok")
+
+
+def test_all_providers_failed_reports_every_error():
+    async def scenario():
+        return await main.race_providers({
+            "groq": FakeStream(error=RuntimeError("invalid api key")),
+            "gemini": FakeStream([], delay=0.01),
+        })
+
+    with pytest.raises(main.AllProvidersFailed) as exc_info:
+        asyncio.run(scenario())
+    assert exc_info.value.errors == {
+        "groq": "invalid api key",
+        "gemini": "returned an empty response",
+    }
+    assert "groq: invalid api key" in str(exc_info.value)
+    assert "gemini: returned an empty response" in str(exc_info.value)
@@ -26,6 +26,8 @@ class WebSocketManager {
         this.reconnectDelay = 1000;
         this.messageQueue = [];
         this.latencyStart = null;
+        this.sessionId = null;
+        this.decoder = new TextDecoder();
 
         // Event callbacks
         this.onMessage = null;
@@ -48,6 +50,8 @@ class WebSocketManager {
 
         try {
             this.socket = new WebSocket(this.url);
+            // Server sends pre-encoded JSON as binary frames
+            this.socket.binaryType = 'arraybuffer';
 
             this.socket.onopen = () => {
                 console.log('✅ WebSocket connected');
@@ -63,7 +67,10 @@ class WebSocketManager {
             };
 
             this.socket.onmessage = (event) => {
-                const data = JSON.parse(event.data);
+                const raw = typeof event.data === 'string'
+                    ? event.data
+                    : this.decoder.decode(event.data);
+                const data = JSON.parse(raw);
                 this.handleMessage(data);
             };
 
@@ -98,6 +105,11 @@ class WebSocketManager {
      */
     handleMessage(data) {
         switch (data.type) {
+            case 'session':
+                // Server-assigned id for the per-connection conversation
+                this.sessionId = data.session_id;
+                break;
+
             case 'thinking':
                 this.onThinking?.();
                 break;